@@ -39,5 +39,6 @@
     ],
     packages=packages,
     include_package_data=False,
-    install_requires=["aiohttp", "requests"],
+    install_requires=["aiohttp", "multidict", "requests", "yarl"],
+    extras_require={"http2": ["httpx[http2]"], "orjson": ["orjson"]},
 )
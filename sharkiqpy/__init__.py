@@ -1,6 +1,6 @@
 """Python API for Shark IQ vacuum robots"""
 
-from .ayla_api import get_ayla_api, AylaApi
+from .ayla_api import async_close_shared_sessions, get_ayla_api, AylaApi
 from .exc import (
     SharkIqError,
     SharkIqAuthExpiringError,
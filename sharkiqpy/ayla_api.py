@@ -8,9 +8,19 @@
 """
 
 import aiohttp
+import asyncio
+import logging
 import requests
+import threading
+import weakref
+import yarl
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import asynccontextmanager
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional
+from multidict import CIMultiDict, CIMultiDictProxy
+from requests.adapters import HTTPAdapter
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple, Union
+from urllib3.util.retry import Retry
 from .const import (
     DEVICE_URL,
     LOGIN_URL,
@@ -20,50 +30,352 @@
 from .exc import SharkIqAuthError, SharkIqAuthExpiringError, SharkIqNotAuthedError
 from .sharkiq import SharkIqVacuum
 
-_session = None
+try:
+    import orjson as json
+except ImportError:
+    try:
+        import ujson as json
+    except ImportError:
+        import json
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+_LOGGER = logging.getLogger(__name__)
+_SIGN_IN_URL = f"{LOGIN_URL:s}/users/sign_in.json"
+_REFRESH_URL = f"{LOGIN_URL:s}/users/refresh_token.json"
+_SIGN_OUT_URL = f"{LOGIN_URL:s}/users/sign_out.json"
+_DEVICES_URL = f"{DEVICE_URL:s}/apiv1/devices.json"
+_AUTH_EXPIRY_MARGIN = timedelta(seconds=600)  # Refresh this long before the token expires
+
+# Default aiohttp.TCPConnector settings: pool and keep connections to the Ayla hosts alive, and cache their DNS
+CONNECTOR_DEFAULTS = {
+    'limit': 32,
+    'limit_per_host': 8,
+    'keepalive_timeout': 75,
+    'ttl_dns_cache': 300,
+}  # type: Dict[str, Any]
+
+# Most requests one AylaApi will have in flight at once, matching the connector's per-host limit so that
+# bursts queue up here instead of being throttled by Ayla
+MAX_CONCURRENT_REQUESTS = CONNECTOR_DEFAULTS['limit_per_host']
+
+_session = None  # type: Optional[aiohttp.ClientSession]
+_session_loop = None  # type: Optional[asyncio.AbstractEventLoop]
+_http2_client = None  # type: Optional[httpx.AsyncClient]
+_http2_client_loop = None  # type: Optional[asyncio.AbstractEventLoop]
+_http2_sync_client = None  # type: Optional[httpx.Client]
+_rsession = None  # type: Optional[requests.Session]
+
+
+def _running_loop() -> Optional[asyncio.AbstractEventLoop]:
+    """The running event loop, or None outside of one"""
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+
+
+def _new_rsession() -> requests.Session:
+    """Create a requests Session with pooled, retrying connections"""
+    session = requests.Session()
+    retry = Retry(total=3, backoff_factor=0.3, status_forcelist=[502, 503, 504])
+    session.mount("https://", HTTPAdapter(pool_connections=20, pool_maxsize=20, max_retries=retry))
+    return session
+
+
+def _get_rsession() -> requests.Session:
+    """Get the requests Session shared by all AylaApi objects, creating it if needed"""
+    global _rsession
+    if _rsession is None:
+        _rsession = _new_rsession()
+    return _rsession
+
+
+def _close_rsession():
+    """Close the shared requests Session"""
+    global _rsession
+    if _rsession is not None:
+        _rsession.close()
+        _rsession = None
+
+
+def _new_session(connector_kwargs: Optional[Dict[str, Any]] = None) -> aiohttp.ClientSession:
+    """Create an aiohttp ClientSession, applying connector_kwargs over CONNECTOR_DEFAULTS"""
+    connector = aiohttp.TCPConnector(**{**CONNECTOR_DEFAULTS, **(connector_kwargs or {})})
+    return aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=30), raise_for_status=True)
+
+
+def _get_session() -> aiohttp.ClientSession:
+    """
+    Get the aiohttp ClientSession shared by all AylaApi objects, creating it if needed.
+    A session only works in the event loop it was created in, so a new loop gets a new one.
+    """
+    global _session, _session_loop
+    loop = _running_loop()
+    if _session is None or _session.closed or _session_loop is not loop:
+        _session = _new_session()
+        _session_loop = loop
+    return _session
+
+
+async def _close_session():
+    """Close the shared aiohttp ClientSession"""
+    global _session
+    if _session is not None:
+        if _session_loop is _running_loop():
+            await _session.close()
+        _session = None
+
+
+def _http2_limits() -> "httpx.Limits":
+    """httpx connection limits matching CONNECTOR_DEFAULTS"""
+    return httpx.Limits(
+        max_connections=CONNECTOR_DEFAULTS['limit'],
+        max_keepalive_connections=CONNECTOR_DEFAULTS['limit_per_host'],
+    )
+
+
+def _get_http2_client() -> "httpx.AsyncClient":
+    """Get the httpx AsyncClient shared by all AylaApi objects using HTTP/2, creating it if needed"""
+    global _http2_client, _http2_client_loop
+    loop = _running_loop()
+    if _http2_client is None or _http2_client.is_closed or _http2_client_loop is not loop:
+        transport = httpx.AsyncHTTPTransport(http2=True, limits=_http2_limits(), retries=2)
+        _http2_client = httpx.AsyncClient(transport=transport, timeout=30.0)
+        _http2_client_loop = loop
+    return _http2_client
+
+
+def _get_http2_sync_client() -> "httpx.Client":
+    """Get the httpx Client shared by all AylaApi objects using HTTP/2 synchronously, creating it if needed"""
+    global _http2_sync_client
+    if _http2_sync_client is None or _http2_sync_client.is_closed:
+        transport = httpx.HTTPTransport(http2=True, limits=_http2_limits(), retries=2)
+        _http2_sync_client = httpx.Client(transport=transport, timeout=30.0)
+    return _http2_sync_client
+
+
+async def _close_http2_client():
+    """Close the shared httpx AsyncClient"""
+    global _http2_client
+    if _http2_client is not None:
+        if _http2_client_loop is _running_loop():
+            await _http2_client.aclose()
+        _http2_client = None
+
+
+def _close_http2_sync_client():
+    """Close the shared httpx Client"""
+    global _http2_sync_client
+    if _http2_sync_client is not None:
+        _http2_sync_client.close()
+        _http2_sync_client = None
+
+
+async def async_close_shared_sessions():
+    """
+    Close the sessions shared by AylaApi objects, e.g., when shutting down.
+    They will be recreated if they are needed again.
+    """
+    _close_rsession()
+    await _close_session()
+    await _close_http2_client()
+    _close_http2_sync_client()
 
 
-def get_ayla_api(username: str, password: str, websession: Optional[aiohttp.ClientSession] = None):
+class _Http2Response:
+    """Wrap an httpx Response in the parts of the aiohttp ClientResponse interface we use"""
+
+    def __init__(self, response: "httpx.Response"):
+        self._response = response
+
+    async def __aenter__(self) -> "_Http2Response":
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self._response.aclose()
+
+    @property
+    def status(self) -> int:
+        return self._response.status_code
+
+    @property
+    def headers(self):
+        return self._response.headers
+
+    async def read(self) -> bytes:
+        return await self._response.aread()
+
+    def status_error(self) -> aiohttp.ClientResponseError:
+        """The error aiohttp would raise for this response, so callers see the same exception on either transport"""
+        request = self._response.request
+        url = yarl.URL(str(request.url))
+        request_info = aiohttp.RequestInfo(
+            url, request.method, CIMultiDictProxy(CIMultiDict(request.headers.multi_items())), url
+        )
+        return aiohttp.ClientResponseError(
+            request_info,
+            (),
+            status=self._response.status_code,
+            message=self._response.reason_phrase,
+            headers=CIMultiDictProxy(CIMultiDict(self._response.headers.multi_items())),
+        )
+
+    async def json(self):
+        return json.loads(await self.read())
+
+
+def get_ayla_api(
+        username: str,
+        password: str,
+        websession: Optional[aiohttp.ClientSession] = None,
+        http2: bool = False,
+        connector_kwargs: Optional[Dict[str, Any]] = None,
+        shared_session: bool = True):
     """Get an AylaApi object"""
-    return AylaApi(username, password, SHARK_APP_ID, SHARK_APP_SECRET, websession=websession)
+    return AylaApi(
+        username,
+        password,
+        SHARK_APP_ID,
+        SHARK_APP_SECRET,
+        websession=websession,
+        http2=http2,
+        connector_kwargs=connector_kwargs,
+        shared_session=shared_session,
+    )
 
 
 class AylaApi:
     """Simple Ayla Networks API wrapper"""
 
+    # Live instances by credentials, so that everything using the same account shares one authentication
+    _instances = weakref.WeakValueDictionary()  # type: weakref.WeakValueDictionary
+
+    def __new__(
+            cls,
+            email: str,
+            password: str,
+            app_id: str,
+            app_secret: str,
+            websession: Optional[aiohttp.ClientSession] = None,
+            http2: bool = False,
+            connector_kwargs: Optional[Dict[str, Any]] = None,
+            shared_session: bool = True):
+        key = (cls, email, password, app_id, app_secret)
+        instance = cls._instances.get(key)
+        if instance is not None and instance._transport_args == (websession, http2, connector_kwargs, shared_session):
+            return instance
+        # Different credentials or transport settings get a new object, leaving any existing one registered
+        instance = super().__new__(cls)
+        cls._instances.setdefault(key, instance)
+        return instance
+
     def __init__(
             self,
             email: str,
             password: str,
             app_id: str,
             app_secret: str,
-            websession: Optional[aiohttp.ClientSession] = None):
+            websession: Optional[aiohttp.ClientSession] = None,
+            http2: bool = False,
+            connector_kwargs: Optional[Dict[str, Any]] = None,
+            shared_session: bool = True):
+        if getattr(self, '_initialized', False):
+            return  # An existing instance with the same credentials and settings, which is already set up
+        if http2 and httpx is None:
+            raise ImportError('HTTP/2 support requires httpx.  Install it with `pip install sharkiqpy[http2]`.')
+        self._transport_args = (websession, http2, connector_kwargs, shared_session)
         self._email = email
         self._password = password
         self._access_token = None  # type: Optional[str]
         self._refresh_token = None  # type: Optional[str]
         self._auth_expiration = None  # type: Optional[datetime]
+        self._auth_refresh_due = None  # type: Optional[datetime]  # When the token starts expiring soon
         self._is_authed = False  # type: bool
+        self._auth_header = None  # type: Optional[Dict[str, str]]
+        self._loop = None  # type: Optional[asyncio.AbstractEventLoop]  # The loop our asyncio objects belong to
+        self._auth_lock = None  # type: Optional[asyncio.Lock]
+        self._request_semaphore = None  # type: Optional[asyncio.Semaphore]
+        self._sync_auth_lock = threading.Lock()
+        self._auth_refresh_handle = None  # type: Optional[asyncio.TimerHandle]
+        self._auth_refresh_task = None  # type: Optional[asyncio.Future]
         self._app_id = app_id
         self._app_secret = app_secret
+        self._login_data = {
+            "user": {
+                "email": self._email,
+                "password": self._password,
+                "application": {"app_id": self._app_id, "app_secret": self._app_secret},
+            }
+        }  # type: Dict[str, Dict]  # Prettily formatted data for the login flow
         self.websession = websession
+        self._owns_websession = False
+        self._connector_kwargs = connector_kwargs
+        self._shared_session = shared_session
+        self._http2 = http2
+        self._rsession = None  # type: Optional[requests.Session]  # Only set if we have a Session of our own
+        self._initialized = True
 
     def ensure_session(self) -> aiohttp.ClientSession:
         """Ensure that we have an aiohttp ClientSession"""
+        self._check_loop()
         if self.websession is None:
-            self.websession = aiohttp.ClientSession()
+            if self._connector_kwargs or not self._shared_session:
+                # This object gets a session of its own, which it is responsible for closing
+                self.websession = _new_session(self._connector_kwargs)
+                self._owns_websession = True
+            else:
+                # Not cached, so we pick up the new shared session after async_close_shared_sessions
+                return _get_session()
         return self.websession
 
-    @property
-    def _login_data(self) -> Dict[str, Dict]:
-        """Prettily formatted data for the login flow"""
-        return {
-            "user": {
-                "email": self._email,
-                "password": self._password,
-                "application": {"app_id": self._app_id, "app_secret": self._app_secret},
-            }
-        }
+    def _ensure_sync_session(self) -> requests.Session:
+        """Ensure that we have a requests Session"""
+        if self._shared_session:
+            # Not cached, so we pick up the new shared session after async_close_shared_sessions
+            return _get_rsession()
+        if self._rsession is None:
+            # This object gets a session of its own, which it is responsible for closing
+            self._rsession = _new_rsession()
+        return self._rsession
+
+    def close(self):
+        """
+        Close this object's own requests Session, if it has one.  The shared
+        Session is left open; use `async_close_shared_sessions` to close it.
+        """
+        if self._rsession is not None:
+            self._rsession.close()
+            self._rsession = None
+
+    def _check_loop(self):
+        """
+        Drop the asyncio objects created in another event loop, e.g. by an earlier
+        asyncio.run, since they can't be used in the running one.
+        """
+        loop = _running_loop()
+        if loop is None or loop is self._loop:
+            return
+        self._loop = loop
+        self._auth_lock = None
+        self._request_semaphore = None
+        self._auth_refresh_handle = None  # Would never fire; expiry is checked on demand instead
+        if self._owns_websession:
+            self.websession = None
+            self._owns_websession = False
+
+    async def async_close(self):
+        """
+        Close this object's own aiohttp ClientSession, if it has one.  Shared
+        sessions and sessions passed in as `websession` are left open.
+        """
+        if self.websession is not None and self._owns_websession:
+            await self.websession.close()
+            self.websession = None
+            self._owns_websession = False
 
     def _set_credentials(self, status_code: int, login_result: Dict):
         """Update the internal credentials store."""
@@ -75,35 +387,89 @@ def _set_credentials(self, status_code: int, login_result: Dict):
         self._access_token = login_result["access_token"]
         self._refresh_token = login_result["refresh_token"]
         self._auth_expiration = datetime.now() + timedelta(seconds=login_result["expires_in"])
+        self._auth_refresh_due = self._auth_expiration - _AUTH_EXPIRY_MARGIN
+        self._auth_header = {"Authorization": f"auth_token {self._access_token:s}"}
         self._is_authed = True
+        self._schedule_auth_refresh(login_result["expires_in"])
+
+    def _schedule_auth_refresh(self, expires_in: int):
+        """If we are running in an event loop, refresh the token in the background before it starts expiring"""
+        self._cancel_auth_refresh()
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return  # Synchronous use, so the caller is responsible for refreshing
+        delay = expires_in - _AUTH_EXPIRY_MARGIN.total_seconds()
+        if delay > 0:
+            self._auth_refresh_handle = loop.call_later(delay, self._start_auth_refresh)
+
+    def _cancel_auth_refresh(self):
+        """Cancel any scheduled background refresh"""
+        if self._auth_refresh_handle is not None:
+            self._auth_refresh_handle.cancel()
+            self._auth_refresh_handle = None
+
+    def _start_auth_refresh(self):
+        """Kick off the scheduled background refresh"""
+        # The timer has fired, so from here on expiry is checked on demand until the refresh succeeds
+        self._auth_refresh_handle = None
+        self._auth_refresh_task = asyncio.ensure_future(self._async_background_refresh())
+
+    async def _async_background_refresh(self):
+        """Refresh the authentication, falling back to on-demand expiry checks if that fails"""
+        try:
+            await self.async_refresh_auth()
+        except Exception as exc:
+            # Nobody awaits this task, so log rather than raise; requests will refresh on demand instead
+            _LOGGER.warning('Error refreshing Ayla Networks authentication in the background', exc_info=exc)
 
     def sign_in(self):
-        """Authenticate to Ayla API synchronously."""
-        login_data = self._login_data
-        resp = requests.post(f"{LOGIN_URL:s}/users/sign_in.json", json=login_data)
-        self._set_credentials(resp.status_code, resp.json())
+        """Authenticate to Ayla API synchronously.  Concurrent calls are coalesced into a single sign in."""
+        stale_token = self._access_token
+        with self._sync_auth_lock:
+            if self._access_token != stale_token:
+                return  # Another thread signed in while we were waiting for the lock
+            resp = self._ensure_sync_session().post(_SIGN_IN_URL, json=self._login_data)
+            self._set_credentials(resp.status_code, resp.json())
 
     def refresh_auth(self):
-        """Refresh the authentication synchronously"""
-        refresh_data = {"user": {"refresh_token": self._refresh_token}}
-        resp = requests.post(f"{LOGIN_URL:s}/users/refresh_token.json", json=refresh_data)
-        self._set_credentials(resp.status_code, resp.json())
+        """Refresh the authentication synchronously.  Concurrent calls are coalesced into a single refresh."""
+        stale_token = self._access_token
+        with self._sync_auth_lock:
+            if self._access_token != stale_token:
+                return  # Another thread refreshed while we were waiting for the lock
+            refresh_data = {"user": {"refresh_token": self._refresh_token}}
+            resp = self._ensure_sync_session().post(_REFRESH_URL, json=refresh_data)
+            self._set_credentials(resp.status_code, resp.json())
+
+    def _get_auth_lock(self) -> asyncio.Lock:
+        """Get the lock serializing async sign ins and refreshes, creating it in the running loop if needed"""
+        self._check_loop()
+        if self._auth_lock is None:
+            self._auth_lock = asyncio.Lock()
+        return self._auth_lock
 
     async def async_sign_in(self):
-        """Authenticate to Ayla API synchronously."""
-        session = self.ensure_session()
-        login_data = self._login_data
-        async with session.post(f"{LOGIN_URL:s}/users/sign_in.json", json=login_data) as resp:
-            self._set_credentials(resp.status, await resp.json())
+        """Authenticate to Ayla API asynchronously.  Concurrent calls are coalesced into a single sign in."""
+        stale_token = self._access_token
+        async with self._get_auth_lock():
+            if self._access_token != stale_token:
+                return  # Someone else signed in while we were waiting for the lock
+            session = self.ensure_session()
+            async with session.post(_SIGN_IN_URL, json=self._login_data, raise_for_status=False) as resp:
+                self._set_credentials(resp.status, await resp.json())
 
     async def async_refresh_auth(self):
-        """Refresh the authentication synchronously."""
-        session = self.ensure_session()
-        refresh_data = {"user": {"refresh_token": self._refresh_token}}
-        async with session.post(f"{LOGIN_URL:s}/users/refresh_token.json", json=refresh_data) as resp:
-            self._set_credentials(resp.status, await resp.json())
+        """Refresh the authentication asynchronously.  Concurrent calls are coalesced into a single refresh."""
+        stale_token = self._access_token
+        async with self._get_auth_lock():
+            if self._access_token != stale_token:
+                return  # Someone else refreshed while we were waiting for the lock
+            session = self.ensure_session()
+            refresh_data = {"user": {"refresh_token": self._refresh_token}}
+            async with session.post(_REFRESH_URL, json=refresh_data, raise_for_status=False) as resp:
+                self._set_credentials(resp.status, await resp.json())
 
-    @property
     def sign_out_data(self) -> Dict:
         """Payload for the sign_out call"""
         return {"user": {"access_token": self._access_token}}
@@ -114,16 +480,19 @@ def _clear_auth(self):
         self._access_token = None
         self._refresh_token = None
         self._auth_expiration = None
+        self._auth_refresh_due = None
+        self._auth_header = None
+        self._cancel_auth_refresh()
 
     def sign_out(self):
         """Sign out and invalidate the access token"""
-        requests.post(f"{LOGIN_URL:s}/users/sign_out.json", json=self.sign_out_data)
+        self._ensure_sync_session().post(_SIGN_OUT_URL, json=self.sign_out_data())
         self._clear_auth()
 
     async def async_sign_out(self):
         """Sign out and invalidate the access token"""
         session = self.ensure_session()
-        async with session.post(f"{LOGIN_URL:s}/users/sign_out.json", json=self.sign_out_data) as _:
+        async with session.post(_SIGN_OUT_URL, json=self.sign_out_data(), raise_for_status=False) as _:
             pass
         self._clear_auth()
 
@@ -149,70 +518,210 @@ def token_expiring_soon(self) -> bool:
         """Return true if the token will expire soon"""
         if self.auth_expiration is None:
             return True
-        return datetime.now() > self.auth_expiration - timedelta(seconds=600)  # Prevent timeout immediately following
+        return datetime.now() > self.auth_expiration - _AUTH_EXPIRY_MARGIN  # Prevent timeout immediately following
 
     def check_auth(self, raise_expiring_soon=True):
         """Confirm authentication status"""
-        if not self._access_token or not self._is_authed or self.token_expired:
+        # Called on every request, so check the expiry directly with a single clock read
+        now = datetime.now()
+        if (not self._access_token or not self._is_authed or self._auth_expiration is None
+                or now > self._auth_expiration):
             self._is_authed = False
             raise SharkIqNotAuthedError()
-        elif raise_expiring_soon and self.token_expiring_soon:
+        elif raise_expiring_soon and now > self._auth_expiration - _AUTH_EXPIRY_MARGIN:
             raise SharkIqAuthExpiringError()
 
     @property
     def auth_header(self) -> Dict[str, str]:
         self.check_auth()
-        return {"Authorization": f"auth_token {self._access_token:s}"}
+        return self._auth_header
 
-    def _get_headers(self, fn_kwargs) -> Dict[str, str]:
+    def _fresh_auth_header(self) -> Optional[Dict[str, str]]:
         """
-        Extract the headers element from fn_kwargs, removing it if it exists
-        and updating with self.auth_header.
+        The auth header if the token is not yet due for a refresh, else None.  This is
+        the per-request fast path, so it is a single clock read and comparison.
         """
-        try:
-            headers = fn_kwargs['headers']
-        except KeyError:
-            headers = {}
-        else:
-            del fn_kwargs['headers']
-        headers.update(self.auth_header)
-        return headers
+        refresh_due = self._auth_refresh_due
+        if refresh_due is not None and datetime.now() < refresh_due:
+            return self._auth_header
+        return None
 
-    def request(self, method: str, url: str, **kwargs) -> requests.Response:
-        headers = self._get_headers(kwargs)
-        return requests.request(method, url, headers=headers, **kwargs)
+    @staticmethod
+    def _get_headers(fn_kwargs, auth_header: Dict[str, str]) -> Dict[str, str]:
+        """
+        Extract the headers element from fn_kwargs, removing it if it exists,
+        and merge in auth_header.  With no other headers, auth_header is used as is.
+        """
+        headers = fn_kwargs.pop('headers', None)
+        if not headers:
+            return auth_header
+        return {**headers, **auth_header}
 
-    async def async_request(self, http_method: str, url: str, **kwargs):
+    @staticmethod
+    def _encode_json_body(fn_kwargs, headers: Dict[str, str], body_kwarg: str = 'data') -> Dict[str, str]:
+        """
+        Serialize the json element of fn_kwargs ourselves, using the fastest
+        available encoder, and return headers with the matching Content-Type.
+        """
+        payload = fn_kwargs.pop('json', None)
+        if payload is None:
+            return headers
+        fn_kwargs[body_kwarg] = json.dumps(payload)
+        return {**headers, 'Content-Type': 'application/json'}
+
+    def request(
+            self,
+            method: str,
+            url: str,
+            auto_refresh: bool = True,
+            **kwargs) -> Union[requests.Response, "httpx.Response"]:
+        auth_header = self._fresh_auth_header()
+        if auth_header is None:
+            if auto_refresh and self._refresh_token is not None:
+                # Concurrent threads all end up waiting on the same refresh
+                self.refresh_auth()
+            auth_header = self.auth_header
+        headers = self._get_headers(kwargs, auth_header)
+        if self._http2:
+            # httpx responses have the status_code, headers and content attributes callers rely on
+            headers = self._encode_json_body(kwargs, headers, 'content')
+            return _get_http2_sync_client().request(method, url, headers=headers, **kwargs)
+        headers = self._encode_json_body(kwargs, headers)
+        return self._ensure_sync_session().request(method, url, headers=headers, **kwargs)
+
+    async def _async_ensure_auth(self, auto_refresh: bool = True) -> Dict[str, str]:
+        """
+        Get the auth header for an async request.  The background refresh normally keeps the
+        token fresh; if it is due anyway, e.g. because that refresh failed, refresh it now.
+        """
+        auth_header = self._fresh_auth_header()
+        if auth_header is not None:
+            return auth_header
+        if auto_refresh and self._refresh_token is not None:
+            # Concurrent callers all end up waiting on the same refresh
+            await self.async_refresh_auth()
+        return self.auth_header
+
+    async def async_request(
+            self,
+            http_method: str,
+            url: str,
+            auto_refresh: bool = True,
+            raise_for_status: bool = True,
+            **kwargs):
+        headers = self._get_headers(kwargs, await self._async_ensure_auth(auto_refresh))
+        if self._http2:
+            # Requests multiplexed over a single HTTP/2 connection
+            headers = self._encode_json_body(kwargs, headers, 'content')
+            async with self._get_request_semaphore():
+                resp = await _get_http2_client().request(http_method, url, headers=headers, **kwargs)
+            wrapped = _Http2Response(resp)
+            if raise_for_status and resp.status_code >= 400:
+                await resp.aclose()
+                raise wrapped.status_error()
+            return wrapped
+        headers = self._encode_json_body(kwargs, headers)
         session = self.ensure_session()
-        headers = self._get_headers(kwargs)
-        return session.request(http_method, url, headers=headers, **kwargs)
+        request_cm = session.request(http_method, url, headers=headers, raise_for_status=raise_for_status, **kwargs)
+        return self._bounded_request(request_cm)
+
+    def _get_request_semaphore(self) -> asyncio.Semaphore:
+        """Get the semaphore bounding concurrent requests, creating it in the running loop if needed"""
+        self._check_loop()
+        if self._request_semaphore is None:
+            self._request_semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+        return self._request_semaphore
+
+    @asynccontextmanager
+    async def _bounded_request(self, request_cm):
+        """Hold one of the concurrent request slots for as long as the response is in use"""
+        async with self._get_request_semaphore():
+            async with request_cm as resp:
+                yield resp
 
     def list_devices(self) -> List[Dict]:
-        resp = self.request("get", f"{DEVICE_URL:s}/apiv1/devices.json")
-        devices = resp.json()
+        resp = self.request("get", _DEVICES_URL)
+        devices = json.loads(resp.content)
         if resp.status_code == 401:
             raise SharkIqAuthError(devices["error"]["message"])
         return [d["device"] for d in devices]
 
     async def async_list_devices(self) -> List[Dict]:
-        async with await self.async_request("get", f"{DEVICE_URL:s}/apiv1/devices.json") as resp:
-            devices = await resp.json()
+        async with await self.async_request("get", _DEVICES_URL, raise_for_status=False) as resp:
+            devices = json.loads(await resp.read())
             if resp.status == 401:
                 raise SharkIqAuthError(devices["error"]["message"])
         return [d["device"] for d in devices]
 
     def get_devices(self, update: bool = True) -> List[SharkIqVacuum]:
         devices = [SharkIqVacuum(self, d) for d in self.list_devices()]
-        if update:
-            for device in devices:
+        if update and devices:
+            def _refresh(device: SharkIqVacuum):
                 device.get_metadata()
                 device.update()
+
+            # Refresh the devices in parallel threads sharing the pooled requests session, but don't let one
+            # failure hide the rest
+            errors = []
+            with ThreadPoolExecutor(max_workers=min(len(devices), MAX_CONCURRENT_REQUESTS)) as executor:
+                futures = {executor.submit(_refresh, device): device for device in devices}
+                for future in as_completed(futures):
+                    exc = future.exception()
+                    if exc is not None:
+                        _LOGGER.error('Error updating device %s', futures[future].serial_number, exc_info=exc)
+                        errors.append(exc)
+            if errors:
+                raise errors[0]
         return devices
 
+    @staticmethod
+    def _group_updates(
+            devices_and_props: Dict[SharkIqVacuum, Optional[Iterable[str]]]
+    ) -> List[Tuple[List[SharkIqVacuum], Optional[Set[str]]]]:
+        """
+        Group the requested property names by device serial number so that each
+        device is only fetched once.  A property list of None means a full update.
+        """
+        groups = {}  # type: Dict[str, Tuple[List[SharkIqVacuum], Optional[Set[str]]]]
+        for device, property_list in devices_and_props.items():
+            devices, names = groups.get(device.serial_number, ([], set()))
+            devices.append(device)
+            if property_list is None or names is None:
+                names = None
+            else:
+                names.update(property_list)
+            groups[device.serial_number] = (devices, names)
+        return list(groups.values())
+
+    def batch_update(self, devices_and_props: Dict[SharkIqVacuum, Optional[Iterable[str]]]):
+        """Update several devices, fetching all the properties requested for each device in a single request"""
+        for devices, names in self._group_updates(devices_and_props):
+            properties = devices[0]._fetch_properties(names)
+            for device in devices:
+                device._do_update(names is None, properties)
+
+    async def async_batch_update(self, devices_and_props: Dict[SharkIqVacuum, Optional[Iterable[str]]]):
+        """Update several devices concurrently, fetching all the properties requested for each device at once"""
+        groups = self._group_updates(devices_and_props)
+        results = await asyncio.gather(*(devices[0]._async_fetch_properties(names) for devices, names in groups))
+        for (devices, names), properties in zip(groups, results):
+            for device in devices:
+                device._do_update(names is None, properties)
+
     async def async_get_devices(self, update: bool = True) -> List[SharkIqVacuum]:
         devices = [SharkIqVacuum(self, d) for d in await self.async_list_devices()]
         if update:
-            for device in devices:
+            async def _refresh(device: SharkIqVacuum):
                 await device.async_get_metadata()
                 await device.async_update()
+
+            # Refresh all the devices concurrently, but don't let one failure hide the rest
+            results = await asyncio.gather(*(_refresh(d) for d in devices), return_exceptions=True)
+            errors = []
+            for device, result in zip(devices, results):
+                if isinstance(result, BaseException):
+                    _LOGGER.error('Error updating device %s', device.serial_number, exc_info=result)
+                    errors.append(result)
+            if errors:
+                raise errors[0]
         return devices
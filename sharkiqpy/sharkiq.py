@@ -1,25 +1,34 @@
 """Shark IQ Wrapper"""
 
+import asyncio
 import base64
 import enum
+import hashlib
 import logging
-import requests
-from collections import abc, defaultdict
+import sys
+import threading
+import time
+from collections import abc
 from datetime import datetime
 from pprint import pformat
-from typing import Any, Dict, Iterable, List, Optional, Set, Union, TYPE_CHECKING
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Set, Tuple, Union, TYPE_CHECKING
 from .const import DEVICE_URL
-from .exc import SharkIqReadOnlyPropertyError
+from .exc import SharkIqError, SharkIqReadOnlyPropertyError
 
 try:
-    import ujson as json
+    import orjson as json
 except ImportError:
-    import json
+    try:
+        import ujson as json
+    except ImportError:
+        import json
 
 if TYPE_CHECKING:
     from .ayla_api import AylaApi
 
 TIMESTAMP_FMT = '%Y-%m-%dT%H:%M:%SZ'
+UPDATE_BATCH_WINDOW = 0.05  # Seconds to collect property names for a partial async update before fetching them
+WRITE_BATCH_WINDOW = 0.02  # Seconds to collect async property writes before sending them
 _LOGGER = logging.getLogger(__name__)
 
 PropertyName = Union[str, enum.Enum]
@@ -88,14 +97,52 @@ class Properties(enum.Enum):
 }
 
 
+_SET_PREFIXES = ('SET_', 'set_')
+_PROPERTY_PREFIXES = _SET_PREFIXES + ('GET_', 'get_')
+
+
+def _enum_value(value: Any) -> Any:
+    """Unwrap enum members to their values, passing anything else through"""
+    return value.value if isinstance(value, enum.Enum) else value
+
+
 def _clean_property_name(raw_property_name: str) -> str:
     """Clean up property names"""
-    if raw_property_name[:4].upper() in ['SET_', 'GET_']:
+    if raw_property_name.startswith(_PROPERTY_PREFIXES):
         return raw_property_name[4:]
     else:
         return raw_property_name
 
 
+def _load_properties(body: bytes, property_list: Optional[Iterable[str]] = None) -> List[Dict]:
+    """Parse a properties response, keeping only the properties in property_list if it is given"""
+    properties = json.loads(body)
+    if property_list is None:
+        return properties
+    wanted = {_clean_property_name(name) for name in property_list}
+    return [p for p in properties if _clean_property_name(p['property']['name']) in wanted]
+
+
+_PROPERTY_TYPES = {
+    'boolean': bool,
+    'decimal': float,
+    'integer': int,
+    'string': str,
+}
+
+
+def _cast_property_value(value: Any, value_type: Optional[str]) -> Any:
+    """Cast property value to the appropriate type."""
+    if value is None:
+        return None
+    try:
+        return _PROPERTY_TYPES.get(value_type, lambda x: x)(value)
+    except (TypeError, ValueError) as exc:
+        # If we failed to convert the type, just return the raw value
+        _LOGGER.warning('Error converting property type (value: %r, type: %r)', value, value_type, exc_info=exc)
+        return value
+
+
 class SharkIqVacuum:
     """Shark IQ vacuum entity"""
 
@@ -106,9 +153,23 @@ def __init__(self, ayla_api: "AylaApi", device_dct: Dict):
         self._oem_model_number = device_dct['oem_model']  # type: str
         self._vac_model_number = None  # type: Optional[str]
         self._vac_serial_number = None  # type: Optional[str]
-        self.properties_full = defaultdict(dict)  # Using a defaultdict prevents errors before calling `update()`
+        self.properties_full = {}  # type: Dict[str, Dict]
+        self._values = {}  # type: Dict[str, Any]  # Property values, already cast, backing `property_values`
         self.property_values = SharkPropertiesView(self)
         self._settable_properties = None  # type: Optional[Set]
+        self._endpoint_prefix = f'{DEVICE_URL:s}/apiv1/dsns/{self._dsn:s}/properties/'
+        self._set_endpoints = {}  # type: Dict[str, str]
+        self.update_url = f'{DEVICE_URL:s}/apiv1/dsns/{self._dsn:s}/properties.json'  # Endpoint to fetch device state
+        self._metadata_endpoint = f'{DEVICE_URL:s}/apiv1/dsns/{self._dsn:s}/data.json'
+        self._pending_update_names = set()  # type: Set[str]
+        self._update_batch = None  # type: Optional[asyncio.Future]
+        self._pending_writes = []  # type: List[Tuple[str, Any, asyncio.Future]]
+        self._write_batch = None  # type: Optional[asyncio.Future]
+        self._last_full_update = None  # type: Optional[float]  # time.monotonic() of the last full update
+        self._background_update = None  # type: Optional[asyncio.Future]
+        self._background_update_lock = threading.Lock()
+        self._etag = None  # type: Optional[str]  # ETag of the last full properties response
+        self._properties_digest = None  # type: Optional[bytes]  # Hash of the last full properties response
 
         # Properties
         self._name = device_dct['product_name']
@@ -137,7 +198,7 @@ def serial_number(self) -> str:
     @property
     def metadata_endpoint(self) -> str:
         """Endpoint for device metadata"""
-        return f'{DEVICE_URL:s}/apiv1/dsns/{self._dsn:s}/data.json'
+        return self._metadata_endpoint
 
     def _update_metadata(self, metadata: List[Dict]):
         data = [d['datum'] for d in metadata if d.get('datum', {}).get('key', '') == 'sharkDeviceMobileData']
@@ -154,100 +215,305 @@ def _update_metadata(self, metadata: List[Dict]):
     def get_metadata(self):
         """Fetch device metadata.  Not needed for basic operation."""
         resp = self.ayla_api.request('get', self.metadata_endpoint)
-        self._update_metadata(resp.json())
+        self._update_metadata(json.loads(resp.content))
 
     async def async_get_metadata(self):
         """Fetch device metadata.  Not needed for basic operation."""
         async with await self.ayla_api.async_request('get', self.metadata_endpoint) as resp:
-            resp_data = await resp.json()
+            resp_data = json.loads(await resp.read())
         self._update_metadata(resp_data)
 
     def set_property_endpoint(self, property_name) -> str:
         """Get the API endpoint for a given property"""
-        return f'{DEVICE_URL:s}/apiv1/dsns/{self._dsn:s}/properties/{property_name:s}/datapoints.json'
+        return self._endpoint_prefix + property_name + '/datapoints.json'
+
+    def _get_set_endpoint(self, property_name: str) -> str:
+        """Get the (cached) API endpoint for setting a given property"""
+        end_point = self._set_endpoints.get(property_name)
+        if end_point is None:
+            end_point = self._set_endpoints[property_name] = self.set_property_endpoint(f'SET_{property_name}')
+        return end_point
 
     def get_property_value(self, property_name: PropertyName) -> Any:
         """Get the value of a property from the properties dictionary"""
-        if isinstance(property_name, enum.Enum):
-            property_name = property_name.value
-        return self.property_values[property_name]
+        property_name = _enum_value(property_name)
+        return self.property_values.get(property_name)
+
+    @property
+    def _state_age(self) -> Optional[float]:
+        """Seconds since the last full update, or None if there hasn't been one"""
+        if self._last_full_update is None:
+            return None
+        return time.monotonic() - self._last_full_update
+
+    def get_property_value_swr(
+            self,
+            property_name: PropertyName,
+            max_age: float = 2.0,
+            stale_while_revalidate: float = 30.0) -> Any:
+        """
+        Get the value of a property, updating the device state as needed.  State up to
+        max_age seconds old is used as is.  State up to stale_while_revalidate seconds
+        older than that is used immediately while it is updated in a background thread.
+        Anything older is updated before returning.
+        """
+        age = self._state_age
+        if age is None or age > max_age + stale_while_revalidate:
+            self.update()
+        elif age > max_age and self._background_update_lock.acquire(blocking=False):
+            threading.Thread(target=self._update_in_background, daemon=True).start()
+        return self.get_property_value(property_name)
+
+    def _update_in_background(self):
+        """Update the device state from a background thread"""
+        try:
+            self.update()
+        except Exception as exc:  # Nobody is waiting on this, so all we can do is log it
+            _LOGGER.warning('Error updating %s in the background', self.serial_number, exc_info=exc)
+        finally:
+            self._background_update_lock.release()
+
+    async def async_get_property_value_swr(
+            self,
+            property_name: PropertyName,
+            max_age: float = 2.0,
+            stale_while_revalidate: float = 30.0) -> Any:
+        """
+        Get the value of a property, updating the device state as needed.  State up to
+        max_age seconds old is used as is.  State up to stale_while_revalidate seconds
+        older than that is used immediately while it is updated in the background.
+        Anything older is updated before returning.
+        """
+        age = self._state_age
+        if age is None or age > max_age + stale_while_revalidate:
+            await self.async_update()
+        elif age > max_age and self._background_update is None:
+            self._background_update = asyncio.ensure_future(self._async_update_in_background())
+        return self.get_property_value(property_name)
+
+    async def _async_update_in_background(self):
+        """Update the device state in the background"""
+        try:
+            await self.async_update()
+        except Exception as exc:  # Nobody is waiting on this, so all we can do is log it
+            _LOGGER.warning('Error updating %s in the background', self.serial_number, exc_info=exc)
+        finally:
+            self._background_update = None
+
+    def _set_known_value(self, property_name: str, value: Any):
+        """Record a value we just wrote so `property_values` reflects it"""
+        value_type = self.properties_full.get(property_name, {}).get('base_type')
+        self._values[property_name] = _cast_property_value(value, value_type)
+        # Our state no longer matches the last full response, so don't let the next one be skipped
+        self._etag = None
+        self._properties_digest = None
 
     def set_property_value(self, property_name: PropertyName, value: PropertyValue):
         """Update a property"""
-        if isinstance(property_name, enum.Enum):
-            property_name = property_name.value
-        if isinstance(value, enum.Enum):
-            value = value.value
-        if self.properties_full.get(property_name, {}).get('read_only'):
+        property_name = _enum_value(property_name)
+        value = _enum_value(value)
+        # The readable GET_ entry is read only even when a SET_ entry makes the property writable
+        settable = self._settable_properties is not None and property_name in self._settable_properties
+        if not settable and self.properties_full.get(property_name, {}).get('read_only'):
             raise SharkIqReadOnlyPropertyError(f'{property_name} is read only')
 
-        end_point = self.set_property_endpoint(f'SET_{property_name}')
+        end_point = self._get_set_endpoint(property_name)
         data = {'datapoint': {'value': value}}
         resp = self.ayla_api.request('post', end_point, json=data)
-        self.properties_full[property_name].update(resp.json())
+        datapoint = json.loads(resp.content)['datapoint']
+        self.properties_full.setdefault(sys.intern(property_name), {})['datapoint'] = datapoint
+        self._set_known_value(property_name, value)
 
     async def async_set_property_value(self, property_name: PropertyName, value: PropertyValue):
-        """Update a property async"""
-        if isinstance(property_name, enum.Enum):
-            property_name = property_name.value
-        if isinstance(value, enum.Enum):
-            value = value.value
-
-        end_point = self.set_property_endpoint(f'SET_{property_name}')
-        data = {'datapoint': {'value': value}}
+        """
+        Update a property async.  Writes made within WRITE_BATCH_WINDOW of each
+        other are sent to the API in a single request.
+        """
+        property_name = _enum_value(property_name)
+        value = _enum_value(value)
+
+        datapoint = await self._async_enqueue_write(property_name, value)
+        self.properties_full.setdefault(sys.intern(property_name), {})['datapoint'] = datapoint
+        self._set_known_value(property_name, value)
+
+    async def _async_enqueue_write(self, property_name: str, value: Any) -> Dict:
+        """Queue a property write for the next batch and wait for the resulting datapoint"""
+        result = asyncio.get_running_loop().create_future()
+        self._pending_writes.append((property_name, value, result))
+        if self._write_batch is None:
+            self._write_batch = asyncio.ensure_future(self._async_write_batch())
+        return await result
+
+    async def _async_write_batch(self):
+        """Wait for more writes to come in, then send them all as one batch of datapoints"""
+        writes = None
+        try:
+            await asyncio.sleep(WRITE_BATCH_WINDOW)
+            writes = self._take_pending_writes()
+            await self._async_send_writes(writes)
+        except BaseException as exc:
+            # Whatever went wrong, don't leave any caller waiting on its write forever
+            if writes is None:
+                writes = self._take_pending_writes()
+            for _, _, future in writes:
+                if future.done():
+                    continue
+                if isinstance(exc, asyncio.CancelledError):
+                    future.cancel()
+                else:
+                    future.set_exception(exc)
+            if not isinstance(exc, Exception):
+                raise
+
+    def _take_pending_writes(self) -> List[Tuple[str, Any, asyncio.Future]]:
+        """Take the queued writes, so that new ones start the next batch"""
+        writes = self._pending_writes
+        self._pending_writes = []
+        self._write_batch = None
+        return writes
+
+    async def _async_send_writes(self, writes: List[Tuple[str, Any, asyncio.Future]]):
+        """Send a batch of writes and resolve each caller's future with its datapoint"""
+        end_point = f'{DEVICE_URL:s}/apiv1/batch_datapoints.json'
+        data = {'batch_datapoints': [
+            {'dsn': self._dsn, 'name': f'SET_{property_name}', 'datapoint': {'value': value}}
+            for property_name, value, _ in writes
+        ]}
         async with await self.ayla_api.async_request('post', end_point, json=data) as resp:
-            resp_data = await resp.json()
-        self.properties_full[property_name].update(resp_data)
-
-    @property
-    def update_url(self) -> str:
-        """API endpoint to fetch updated device information"""
-        return f'{DEVICE_URL}/apiv1/dsns/{self.serial_number}/properties.json'
+            results = json.loads(await resp.read())
+
+        for i, (property_name, _, future) in enumerate(writes):
+            if future.done():  # The caller gave up waiting
+                continue
+            result = results[i] if i < len(results) else {}
+            if result.get('status') in (200, 201):
+                future.set_result(result.get('datapoint', {}))
+            else:
+                future.set_exception(
+                    SharkIqError(f'Error setting {property_name} (status: {result.get("status")!r})')
+                )
 
     def update(self, property_list: Optional[Iterable[str]] = None):
         """Update the known device state"""
-        full_update = property_list is None
-        if full_update:
+        if property_list is None:
+            resp = self.ayla_api.request('get', self.update_url, headers=self._conditional_headers)
+            self._do_conditional_update(resp.status_code, resp.headers, resp.content)
+        else:
+            self._do_update(False, self._fetch_properties(property_list))
+
+    def _fetch_properties(self, property_list: Optional[Iterable[str]]) -> List[Dict]:
+        """Fetch all device properties, or only those in property_list"""
+        if property_list is None:
             params = None
         else:
+            property_list = list(property_list)
             params = {'names[]': property_list}
 
         resp = self.ayla_api.request('get', self.update_url, params=params)
-        properties = resp.json()
-        self._do_update(full_update, properties)
+        return _load_properties(resp.content, property_list)
 
     async def async_update(self, property_list: Optional[Iterable[str]] = None):
-        """Update the known device state async"""
-        full_update = property_list is None
-        if full_update:
+        """
+        Update the known device state async.  Partial updates requested within
+        UPDATE_BATCH_WINDOW of each other are combined into a single request.
+        """
+        if property_list is None:
+            headers = self._conditional_headers
+            async with await self.ayla_api.async_request('get', self.update_url, headers=headers) as resp:
+                self._do_conditional_update(resp.status, resp.headers, await resp.read())
+            return
+
+        if self._update_batch is None or self._update_batch.done():
+            # Names left behind by a batch cancelled before it ran were never fetched by anyone
+            self._pending_update_names = set(property_list)
+            self._update_batch = asyncio.ensure_future(self._async_update_batch())
+        else:
+            self._pending_update_names.update(property_list)
+        # Shield the shared fetch so one cancelled caller doesn't cancel it for everyone else
+        await asyncio.shield(self._update_batch)
+
+    async def _async_update_batch(self):
+        """Wait for more property names to come in, then fetch them all at once"""
+        try:
+            await asyncio.sleep(UPDATE_BATCH_WINDOW)
+        finally:
+            # Even if we were cancelled, the next partial update must start a fresh batch
+            property_list = list(self._pending_update_names)
+            self._pending_update_names = set()
+            self._update_batch = None
+        self._do_update(False, await self._async_fetch_properties(property_list))
+
+    async def _async_fetch_properties(self, property_list: Optional[Iterable[str]]) -> List[Dict]:
+        """Fetch all device properties, or only those in property_list, async"""
+        if property_list is None:
             params = None
         else:
+            property_list = list(property_list)
             params = {'names[]': property_list}
 
         async with await self.ayla_api.async_request('get', self.update_url, params=params) as resp:
-            properties = await resp.json()
+            return _load_properties(await resp.read(), property_list)
+
+    @property
+    def _conditional_headers(self) -> Optional[Dict[str, str]]:
+        """Headers to only fetch the full property list if it has changed"""
+        if self._etag:
+            return {'If-None-Match': self._etag}
+        return None
 
-        self._do_update(full_update, properties)
+    def _do_conditional_update(self, status: int, headers: Mapping[str, str], body: bytes):
+        """Do a full update from a properties response, unless nothing has changed since the last one"""
+        if status != 304:
+            self._etag = headers.get('ETag')
+            # Not every endpoint honors If-None-Match, so also check whether we have already seen this exact body
+            digest = hashlib.blake2b(body, digest_size=16).digest()
+            if digest != self._properties_digest:
+                self._do_update(True, json.loads(body))
+                self._properties_digest = digest
+                return
+        # Nothing changed, but we now know the state is current
+        self._last_full_update = time.monotonic()
 
     def _do_update(self, full_update: bool, properties: List[Dict]):
         """Update the internal state from fetched properties"""
-        property_names = {p['property']['name'] for p in properties}
-        settable_properties = {_clean_property_name(p) for p in property_names if p[:3].upper() == 'SET'}
-        readable_properties = {
-            _clean_property_name(p['property']['name']): p['property']
-            for p in properties if p['property']['name'].upper() != 'SET'
-        }
+        settable_properties = set()
+        readable_properties = {}
+        readable_values = {}
+        # Local aliases save a global lookup per property in the loop below
+        clean, intern, cast = _clean_property_name, sys.intern, _cast_property_value
+        # A partial update must not replace readable entries we already have either
+        known_properties = {} if full_update else self.properties_full
+        for p in properties:
+            prop = p['property']
+            name = prop['name']
+            clean_name = intern(clean(name))
+            if name.startswith(_SET_PREFIXES):
+                settable_properties.add(clean_name)
+                # SET_ entries must never clobber the GET_ entry of the same name; they are
+                # only kept for write-only properties that have no readable counterpart
+                if clean_name in readable_properties:
+                    continue
+                known_name = known_properties.get(clean_name, {}).get('name')
+                if known_name is not None and not known_name.startswith(_SET_PREFIXES):
+                    continue
+            elif name.upper() == 'SET':
+                continue
+            readable_properties[clean_name] = prop
+            readable_values[clean_name] = cast(prop.get('value'), prop.get('base_type'))
 
         if full_update or self._settable_properties is None:
             self._settable_properties = settable_properties
         else:
-            self._settable_properties = self._settable_properties.union(settable_properties)
+            self._settable_properties |= settable_properties
 
         # Update the property map so we can update by name instead of by fickle number
         if full_update:
             # Did a full update, so let's wipe everything
-            self.properties_full = defaultdict(dict)
+            self.properties_full = {}
+            self._values = {}
+            self._last_full_update = time.monotonic()
         self.properties_full.update(readable_properties)
+        self._values.update(readable_values)
 
     def set_operating_mode(self, mode: OperatingModes):
         """Set the operating mode.  This is just a convenience wrapper around `set_property_value`"""
@@ -291,8 +557,7 @@ def _get_most_recent_datum(data_list: List[Dict], date_field: str = 'updated_at'
 
     def _get_file_property_endpoint(self, property_name: PropertyName) -> str:
         """Check that property_name is a file property and return its lookup endpoint"""
-        if isinstance(property_name, enum.Enum):
-            property_name = property_name.value
+        property_name = _enum_value(property_name)
 
         property_id = self.properties_full[property_name]['key']
         if self.properties_full[property_name].get('base_type') != 'file':
@@ -307,7 +572,7 @@ def get_file_property_url(self, property_name: PropertyName) -> Optional[str]:
             return None
 
         resp = self.ayla_api.request('get', url)
-        data_list = resp.json()
+        data_list = json.loads(resp.content)
         latest_datum = self._get_most_recent_datum(data_list)
         return latest_datum.get('file')
 
@@ -319,21 +584,21 @@ async def async_get_file_property_url(self, property_name: PropertyName) -> Opti
             return None
 
         async with await self.ayla_api.async_request('get', url) as resp:
-            data_list = await resp.json()
+            data_list = json.loads(await resp.read())
         latest_datum = self._get_most_recent_datum(data_list)
         return latest_datum.get('file')
 
     def get_file_property(self, property_name: PropertyName) -> bytes:
         """Get the latest file for a file property and return as bytes"""
-        # These do not require authentication, so we won't use the ayla_api
+        # These do not require authentication, so skip ayla_api.request but still reuse its pooled connections
         url = self.get_file_property_url(property_name)
-        resp = requests.get(url)
+        resp = self.ayla_api._ensure_sync_session().get(url)
         return resp.content
 
     async def async_get_file_property(self, property_name: PropertyName) -> bytes:
         """Get the latest file for a file property and return as bytes"""
         url = await self.async_get_file_property_url(property_name)
-        session = self.ayla_api.websession
+        session = self.ayla_api.ensure_session()
         async with session.get(url) as resp:
             return await resp.read()
 
@@ -355,38 +620,23 @@ def clean_rooms(self, rooms: List[str]) -> None:
 class SharkPropertiesView(abc.Mapping):
     """Convenience API for shark iq properties"""
 
-    @staticmethod
-    def _cast_value(value, value_type):
-        """Cast property value to the appropriate type."""
-        if value is None:
-            return None
-        type_map = {
-            'boolean': bool,
-            'decimal': float,
-            'integer': int,
-            'string': str,
-        }
-        return type_map.get(value_type, lambda x: x)(value)
-
     def __init__(self, shark: SharkIqVacuum):
         self._shark = shark
 
     def __getitem__(self, key):
-        value = self._shark.properties_full[key].get('value')
-        value_type = self._shark.properties_full[key].get('base_type')
-        try:
-            return self._cast_value(value, value_type)
-        except (TypeError, ValueError) as exc:
-            # If we failed to convert the type, just return the raw value
-            _LOGGER.warning('Error converting property type (value: %r, type: %r)', value, value_type, exc_info=exc)
-            return value
+        return self._shark._values[key]
 
     def __iter__(self):
-        for k in self._shark.properties_full.keys():
-            yield k
+        return iter(self._shark._values)
+
+    def __contains__(self, key) -> bool:
+        return key in self._shark._values
 
     def __len__(self) -> int:
-        return self._shark.properties_full.__len__()
+        return len(self._shark._values)
+
+    def keys(self):
+        return self._shark._values.keys()
 
     def __str__(self) -> str:
         return pformat(dict(self))